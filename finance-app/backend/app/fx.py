@@ -0,0 +1,161 @@
+import math
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from prisma.errors import UniqueViolationError
+from .database import prisma
+
+# Rates are stored as units of currency per one unit of the base currency
+BASE_CURRENCY = "USD"
+
+class FakeFxProvider:
+    """Offline provider with fixed reference rates and a small deterministic daily drift."""
+
+    RATES = {
+        "USD": 1.0,
+        "EUR": 0.92,
+        "GBP": 0.79,
+        "CHF": 0.88,
+        "CAD": 1.36,
+        "BRL": 5.0,
+        "JPY": 149.5,
+    }
+
+    @property
+    def currencies(self):
+        return set(self.RATES)
+
+    def get_rates(self, day, currencies):
+        drift = 1 + 0.01 * math.sin(day.toordinal() / 30)
+        return {c: self.RATES[c] * drift for c in currencies if c in self.RATES and c != BASE_CURRENCY}
+
+provider = FakeFxProvider()
+
+# Stored rates never change, so keep the ones already read in memory
+_rate_cache = {}
+
+def _to_datetime(day):
+    return datetime(day.year, day.month, day.day, tzinfo=timezone.utc)
+
+def _days(start, end):
+    return [start + timedelta(days=i) for i in range((end - start).days + 1)]
+
+async def ensure_rates(currencies, start, end):
+    """Return {(currency, day): rate} for every day in [start, end], filling the store from the provider."""
+    currencies = sorted(set(currencies) - {BASE_CURRENCY})
+    days = _days(start, end)
+    wanted = [(c, d) for c in currencies for d in days]
+
+    missing = [key for key in wanted if key not in _rate_cache]
+    if missing:
+        await _read_stored_rates({c for c, _ in missing}, start, end)
+
+    missing_by_day = defaultdict(set)
+    for currency, day in wanted:
+        if (currency, day) not in _rate_cache:
+            missing_by_day[day].add(currency)
+
+    fetched = {}
+    for day, day_currencies in missing_by_day.items():
+        for currency, rate in provider.get_rates(day, day_currencies).items():
+            fetched[(currency, day)] = rate
+    if fetched:
+        # Concurrent requests (or other workers) may store the same days, upsert
+        # so the second writer doesn't trip the (currency, date) unique constraint
+        try:
+            async with prisma.batch_() as batcher:
+                for (currency, day), rate in fetched.items():
+                    batcher.fxrate.upsert(
+                        where={"currency_date": {"currency": currency, "date": _to_datetime(day)}},
+                        data={
+                            "create": {"currency": currency, "date": _to_datetime(day), "rate": rate},
+                            "update": {}
+                        }
+                    )
+        except UniqueViolationError:
+            # Upserts racing on insert can still collide, the other writer's rows are as good
+            await _read_stored_rates({c for c, _ in fetched}, start, end)
+        for key, rate in fetched.items():
+            _rate_cache.setdefault(key, rate)
+
+    return {key: _rate_cache[key] for key in wanted if key in _rate_cache}
+
+async def _read_stored_rates(currencies, start, end):
+    rows = await prisma.fxrate.find_many(
+        where={
+            "currency": {"in": sorted(currencies)},
+            "date": {"gte": _to_datetime(start), "lte": _to_datetime(end)}
+        }
+    )
+    for row in rows:
+        _rate_cache[(row.currency, row.date.date())] = row.rate
+
+class RateTable:
+    """Daily rates for a date range as a (days x currencies) array.
+
+    Conversions index the array with whole columns of dates and currencies,
+    so converting n amounts is a handful of numpy operations, not n lookups.
+    """
+
+    def __init__(self, start, currencies, rates):
+        self.start = start
+        self.columns = {c: i for i, c in enumerate(currencies)}
+        self.rates = rates
+
+    @classmethod
+    async def load(cls, currencies, start, end):
+        import numpy as np
+
+        n_days = (end - start).days + 1
+        currencies = sorted(set(currencies))
+        if len(currencies) == 1:
+            # Single-currency fast path, every conversion is the identity
+            return cls(start, currencies, np.ones((n_days, 1)))
+
+        currencies = sorted(set(currencies) | {BASE_CURRENCY})
+        rates = np.full((n_days, len(currencies)), np.nan)
+        rates[:, currencies.index(BASE_CURRENCY)] = 1.0
+
+        for (currency, day), rate in (await ensure_rates(currencies, start, end)).items():
+            rates[(day - start).days, currencies.index(currency)] = rate
+        rates = _fill_gaps(rates)
+
+        return cls(start, currencies, rates)
+
+    def convert(self, amounts, currencies, days, to):
+        """Convert amounts[i] from currencies[i] to `to` at the rate of days[i]."""
+        import numpy as np
+
+        amounts = np.asarray(amounts, dtype=float)
+        if amounts.size == 0:
+            return amounts
+
+        codes, inverse = np.unique(np.asarray(currencies), return_inverse=True)
+        unknown = [c for c in codes if c not in self.columns]
+        if unknown or to not in self.columns:
+            raise ValueError(f"No FX rates for {', '.join(unknown or [to])}")
+        cols = np.array([self.columns[c] for c in codes])[inverse]
+
+        offsets = (np.asarray(days, dtype="datetime64[D]") - np.datetime64(self.start, "D")).astype(int)
+        rows = np.clip(offsets, 0, len(self.rates) - 1)
+
+        return amounts / self.rates[rows, cols] * self.rates[rows, self.columns[to]]
+
+    def convert_on(self, amounts, currencies, day, to):
+        import numpy as np
+
+        return self.convert(amounts, currencies, np.full(len(amounts), day, dtype="datetime64[D]"), to)
+
+def _fill_gaps(rates):
+    # Carry the last known rate forward, then the first known rate backward
+    import numpy as np
+
+    def forward(a):
+        idx = np.where(np.isnan(a), 0, np.arange(len(a))[:, None])
+        np.maximum.accumulate(idx, axis=0, out=idx)
+        return a[idx, np.arange(a.shape[1])]
+
+    return forward(forward(rates)[::-1])[::-1]
+
+def check_currency(currency):
+    if currency not in provider.currencies:
+        raise ValueError(f"Unsupported currency: {currency}")
@@ -0,0 +1,66 @@
+from dataclasses import dataclass
+from .models import LotMethod
+
+# Quantities below this are treated as zero to absorb float rounding
+EPSILON = 1e-9
+
+# Open lots fetched per query while matching a sale
+LOT_PAGE_SIZE = 50
+
+@dataclass
+class OpenLot:
+    id: str
+    remaining: float
+    cost_per_share: float
+
+@dataclass
+class LotMatch:
+    lot_id: str
+    quantity: float
+    cost_basis: float
+    expected: float # Remaining in the lot when it was read, guards the update
+    remaining: float # Left in the lot after the match
+
+class InsufficientSharesError(ValueError):
+    pass
+
+def lot_order(method):
+    """Order in which open lots are relieved, createdAt breaks same-day ties."""
+    direction = "desc" if LotMethod(method) == LotMethod.LIFO else "asc"
+    return [{"acquiredAt": direction}, {"createdAt": direction}]
+
+class LotMatcher:
+    """Relieves a sale from open lots fed to it in lot_order, a page at a time.
+
+    Only the k lots the sale touches are read. FIFO and LIFO use each lot's
+    own cost. AVERAGE uses the position's average cost for every share and
+    relieves lots oldest first, which leaves the remaining average unchanged.
+    """
+
+    def __init__(self, quantity, method=LotMethod.FIFO, average_cost=0.0):
+        if quantity <= 0:
+            raise ValueError("Quantity must be positive")
+        self.method = LotMethod(method)
+        self.average_cost = average_cost
+        self.needed = quantity
+        self.matches = []
+
+    @property
+    def done(self):
+        return self.needed <= EPSILON
+
+    def consume(self, lots):
+        for lot in lots:
+            if self.done:
+                break
+            taken = min(lot.remaining, self.needed)
+            self.needed -= taken
+            remaining = lot.remaining - taken
+            if remaining <= EPSILON:
+                remaining = 0.0
+            cost_per_share = self.average_cost if self.method == LotMethod.AVERAGE else lot.cost_per_share
+            self.matches.append(LotMatch(lot.id, taken, taken * cost_per_share, lot.remaining, remaining))
+
+    @property
+    def cost_basis(self):
+        return sum(m.cost_basis for m in self.matches)
@@ -1,7 +1,10 @@
+import os
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from .database import connect_db, disconnect_db
-from .routers import auth, accounts, transactions, dashboard, categories, stocks
+from .startup import prewarm, prewarm_enabled
+from .ratelimit import AdmissionMiddleware, get_admission_stats
+from .routers import auth, accounts, transactions, dashboard, categories, stocks, forecast
 
 app = FastAPI(title="Personal Finance App")
 
@@ -10,6 +13,9 @@ origins = [
     "http://localhost:8000",
 ]
 
+# Added before CORS so CORS wraps it and rejected requests still get CORS headers
+app.add_middleware(AdmissionMiddleware)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,
@@ -21,6 +27,8 @@ app.add_middleware(
 @app.on_event("startup")
 async def startup():
     await connect_db()
+    if prewarm_enabled():
+        prewarm()
 
 @app.on_event("shutdown")
 async def shutdown():
@@ -32,7 +40,14 @@ app.include_router(categories.router)
 app.include_router(transactions.router)
 app.include_router(dashboard.router)
 app.include_router(stocks.router)
+app.include_router(forecast.router)
 
 @app.get("/")
 def read_root():
     return {"message": "Welcome to Personal Finance API"}
+
+# Load and user counts are for internal monitoring only, so this is opt-in
+if os.getenv("EXPOSE_ADMISSION_METRICS", "").lower() in ("1", "true", "yes"):
+    @app.get("/metrics/admission")
+    def read_admission_stats():
+        return get_admission_stats()
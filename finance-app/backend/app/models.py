@@ -1,6 +1,6 @@
 from pydantic import BaseModel, EmailStr
 from typing import Optional, List
-from datetime import datetime
+from datetime import date, datetime
 from enum import Enum
 
 class AccountType(str, Enum):
@@ -12,6 +12,16 @@ class CategoryType(str, Enum):
     INCOME = "INCOME"
     EXPENSE = "EXPENSE"
 
+class LotMethod(str, Enum):
+    FIFO = "FIFO"
+    LIFO = "LIFO"
+    AVERAGE = "AVERAGE"
+
+class BatchOperationType(str, Enum):
+    CREATE = "CREATE"
+    UPDATE = "UPDATE"
+    DELETE = "DELETE"
+
 # User Models
 class UserCreate(BaseModel):
     email: EmailStr
@@ -49,6 +59,7 @@ class AccountCreate(BaseModel):
     name: str
     type: AccountType
     balance: float
+    currency: str = "USD"
 
 class AccountResponse(AccountCreate):
     id: str
@@ -87,6 +98,7 @@ class AccountUpdate(BaseModel):
     name: Optional[str] = None
     type: Optional[AccountType] = None
     balance: Optional[float] = None
+    currency: Optional[str] = None
 
 class TransactionUpdate(BaseModel):
     date: Optional[datetime] = None
@@ -95,6 +107,28 @@ class TransactionUpdate(BaseModel):
     categoryId: Optional[str] = None
     accountId: Optional[str] = None
 
+# Batch Models
+class TransactionBatchOperation(BaseModel):
+    op: BatchOperationType
+    id: Optional[str] = None # Required for UPDATE and DELETE
+    data: Optional[TransactionUpdate] = None # Required for CREATE and UPDATE
+
+class TransactionBatchRequest(BaseModel):
+    operations: List[TransactionBatchOperation]
+
+class TransactionBatchResult(BaseModel):
+    index: int
+    op: BatchOperationType
+    id: Optional[str] = None
+    status: str # OK, ERROR
+    detail: Optional[str] = None
+
+class TransactionBatchResponse(BaseModel):
+    created: int
+    updated: int
+    deleted: int
+    results: List[TransactionBatchResult]
+
 class TransferRequest(BaseModel):
     fromAccountId: str
     toAccountId: str
@@ -109,6 +143,8 @@ class StockCreate(BaseModel):
     quantity: float
     averagePrice: float
     accountId: str
+    currency: str = "USD"
+    lotMethod: LotMethod = LotMethod.FIFO
 
 class StockResponse(StockCreate):
     id: str
@@ -137,3 +173,57 @@ class StockTransactionResponse(StockTransactionCreate):
 
     class Config:
         orm_mode = True
+
+class TaxLotResponse(BaseModel):
+    id: str
+    stockId: str
+    quantity: float
+    remainingQuantity: float
+    costPerShare: float
+    acquiredAt: datetime
+    transactionId: Optional[str] = None
+
+    class Config:
+        orm_mode = True
+
+class RealizedGainSummary(BaseModel):
+    stockId: str
+    symbol: str
+    currency: str # Amounts below are in the stock's currency
+    quantity: float
+    proceeds: float
+    costBasis: float
+    gain: float
+
+class RealizedGainsResponse(BaseModel):
+    currency: str # Totals are converted at the rate of each sale date
+    proceeds: float
+    costBasis: float
+    gain: float
+    stocks: List[RealizedGainSummary]
+
+class PortfolioResponse(BaseModel):
+    currency: str
+    marketValue: float
+    costBasis: float
+    unrealizedGain: float
+
+# Forecast Models
+class ForecastEvent(BaseModel):
+    date: date
+    description: str
+    amount: float
+    period: str # WEEKLY, MONTHLY, ANNUAL
+    balance: float # Projected balance after the event
+
+class AccountForecast(BaseModel):
+    accountId: str
+    name: str
+    currency: str
+    currentBalance: float
+    projectedBalance: float
+    upcoming: List[ForecastEvent]
+
+class ForecastResponse(BaseModel):
+    days: int
+    accounts: List[AccountForecast]
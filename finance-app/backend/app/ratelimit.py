@@ -0,0 +1,201 @@
+import math
+import os
+import time
+from collections import OrderedDict, defaultdict
+from dataclasses import dataclass
+from fastapi import Depends, HTTPException, status
+from fastapi.responses import JSONResponse
+from jose import JWTError, jwt
+from .dependencies import get_current_user
+from .utils import SECRET_KEY, ALGORITHM
+
+@dataclass
+class RouteClassLimits:
+    user_rate: float # tokens refilled per second, per user
+    user_burst: float
+    global_rate: float # tokens refilled per second, shared by all users
+    global_burst: float
+    max_concurrency: int # in-flight requests per worker
+
+def _limits_from_env(name, default):
+    # e.g. RATE_LIMIT_BULK="0.2,2,5,20,4"
+    value = os.getenv(f"RATE_LIMIT_{name.upper()}")
+    if not value:
+        return default
+    user_rate, user_burst, global_rate, global_burst, max_concurrency = value.split(",")
+    return RouteClassLimits(
+        float(user_rate), float(user_burst), float(global_rate), float(global_burst), int(max_concurrency)
+    )
+
+ROUTE_CLASSES = {
+    # Stock price sync, hits the market data provider once per holding
+    "market_data": _limits_from_env("market_data", RouteClassLimits(1 / 60, 2, 1, 10, 4)),
+    # File imports and batch mutations
+    "bulk": _limits_from_env("bulk", RouteClassLimits(0.2, 5, 5, 20, 8)),
+    # Dashboard and other aggregations over the whole ledger
+    "analytics": _limits_from_env("analytics", RouteClassLimits(1, 10, 50, 200, 32)),
+}
+
+# Routes with large bodies admitted by AdmissionMiddleware, keyed by (method, path).
+# FastAPI reads and parses request bodies before resolving dependencies, so
+# admission() on these would only reject after the whole body was uploaded.
+BODY_ADMISSION_ROUTES = {
+    ("POST", "/transactions/import"): "bulk",
+    ("POST", "/transactions/batch"): "bulk",
+}
+
+# Least recently used user buckets are dropped past this many
+MAX_TRACKED_USERS = 10000
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self, now=None):
+        """Take a token if one is available, otherwise return seconds until one is."""
+        self._refill(time.monotonic() if now is None else now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def refund(self):
+        self.tokens = min(self.burst, self.tokens + 1)
+
+class AdmissionController:
+    """Token buckets and concurrency caps for one route class.
+
+    Everything runs on the event loop thread without awaiting in between,
+    so plain counters are enough.
+    """
+
+    def __init__(self, name, limits):
+        self.name = name
+        self.limits = limits
+        self.global_bucket = TokenBucket(limits.global_rate, limits.global_burst)
+        self.user_buckets = OrderedDict()
+        self.in_flight = 0
+
+    def _user_bucket(self, user_id):
+        bucket = self.user_buckets.get(user_id)
+        if bucket is None:
+            bucket = TokenBucket(self.limits.user_rate, self.limits.user_burst)
+            self.user_buckets[user_id] = bucket
+            # The oldest bucket has usually refilled by now, dropping it costs at most a fresh burst
+            if len(self.user_buckets) > MAX_TRACKED_USERS:
+                self.user_buckets.popitem(last=False)
+        self.user_buckets.move_to_end(user_id)
+        return bucket
+
+    def admit(self, user_id):
+        if self.in_flight >= self.limits.max_concurrency:
+            _reject(self.name, "concurrency", status.HTTP_503_SERVICE_UNAVAILABLE, 1)
+
+        user_bucket = self._user_bucket(user_id)
+        wait = user_bucket.try_acquire()
+        if wait:
+            _reject(self.name, "user_rate", status.HTTP_429_TOO_MANY_REQUESTS, wait)
+
+        wait = self.global_bucket.try_acquire()
+        if wait:
+            user_bucket.refund()
+            _reject(self.name, "global_rate", status.HTTP_503_SERVICE_UNAVAILABLE, wait)
+
+        self.in_flight += 1
+        admitted[self.name] += 1
+
+    def release(self):
+        self.in_flight -= 1
+
+controllers = {name: AdmissionController(name, limits) for name, limits in ROUTE_CLASSES.items()}
+admitted = defaultdict(int)
+rejected = defaultdict(int)
+
+def _reject(route_class, reason, status_code, retry_after):
+    rejected[(route_class, reason)] += 1
+    raise HTTPException(
+        status_code=status_code,
+        detail="Too many requests, please retry later",
+        headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+    )
+
+def admission(route_class):
+    """Dependency that sheds load for an expensive route class.
+
+    Usage: @router.post("/sync", dependencies=[Depends(admission("market_data"))])
+    """
+    controller = controllers[route_class]
+
+    async def dependency(user=Depends(get_current_user)):
+        # Keyed by email to share buckets with AdmissionMiddleware, which only sees the token
+        controller.admit(user.email)
+        try:
+            yield
+        finally:
+            controller.release()
+
+    return dependency
+
+def _token_subject(scope):
+    for name, value in scope["headers"]:
+        if name == b"authorization":
+            scheme, _, token = value.decode("latin-1").partition(" ")
+            if scheme.lower() != "bearer":
+                return None
+            try:
+                return jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM]).get("sub")
+            except JWTError:
+                return None
+    return None
+
+class AdmissionMiddleware:
+    """Admits BODY_ADMISSION_ROUTES before the request body is read.
+
+    Requests without a valid token pass through and get their 401 from the route.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        route_class = None
+        if scope["type"] == "http":
+            route_class = BODY_ADMISSION_ROUTES.get((scope["method"], scope["path"].rstrip("/")))
+        subject = _token_subject(scope) if route_class else None
+        if subject is None:
+            await self.app(scope, receive, send)
+            return
+
+        controller = controllers[route_class]
+        try:
+            controller.admit(subject)
+        except HTTPException as e:
+            response = JSONResponse({"detail": e.detail}, status_code=e.status_code, headers=e.headers)
+            await response(scope, receive, send)
+            return
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            controller.release()
+
+def get_admission_stats():
+    return {
+        name: {
+            "inFlight": controller.in_flight,
+            "maxConcurrency": controller.limits.max_concurrency,
+            "trackedUsers": len(controller.user_buckets),
+            "admitted": admitted[name],
+            "rejected": {
+                reason: count for (route_class, reason), count in rejected.items() if route_class == name
+            },
+        }
+        for name, controller in controllers.items()
+    }
@@ -0,0 +1,177 @@
+import calendar
+import re
+import time
+from bisect import insort
+from collections import OrderedDict, defaultdict
+from dataclasses import dataclass
+from datetime import date, timedelta
+from .database import prisma
+
+# Period name -> (nominal gap in days, allowed deviation in days)
+PERIODS = {
+    "WEEKLY": (7.0, 1.0),
+    "MONTHLY": (30.44, 3.0),
+    "ANNUAL": (365.25, 7.0),
+}
+
+# A series needs this many occurrences before it is trusted
+MIN_OCCURRENCES = 3
+
+# Series that missed this many periods are considered ended
+MAX_MISSED_PERIODS = 2
+
+# Histories are per worker, expire them so other workers' writes show up
+CACHE_TTL_SECONDS = 600
+MAX_CACHED_USERS = 1000
+
+_NON_WORDS = re.compile(r"[^a-z]+")
+
+def normalize_description(description):
+    # Drop dates, reference numbers and punctuation: "NETFLIX.COM 12/03 #4411" -> "netflix com"
+    return _NON_WORDS.sub(" ", description.lower()).strip()
+
+def series_key(transaction):
+    return (transaction.accountId, normalize_description(transaction.description), round(transaction.amount))
+
+def _add_months(day, months, anchor_day):
+    month_index = day.month - 1 + months
+    year, month = day.year + month_index // 12, month_index % 12 + 1
+    return date(year, month, min(anchor_day, calendar.monthrange(year, month)[1]))
+
+@dataclass
+class RecurringSeries:
+    accountId: str
+    description: str
+    amount: float
+    period: str
+    lastDate: date
+    count: int
+
+    def is_active(self, today):
+        return (today - self.lastDate).days <= PERIODS[self.period][0] * MAX_MISSED_PERIODS
+
+    def occurrences(self, start, end):
+        """Projected dates from `start` up to and including `end`."""
+        dates = []
+        k = 1
+        while True:
+            if self.period == "WEEKLY":
+                day = self.lastDate + timedelta(days=7 * k)
+            elif self.period == "MONTHLY":
+                day = _add_months(self.lastDate, k, self.lastDate.day)
+            else:
+                day = _add_months(self.lastDate, 12 * k, self.lastDate.day)
+            if day > end:
+                return dates
+            if day >= start:
+                dates.append(day)
+            k += 1
+
+def detect_series(groups):
+    """Classify every group of occurrences in one vectorized pass.
+
+    `groups` maps a series key to {"days": sorted date ordinals, "description", "amount"}.
+    Returns {key: RecurringSeries} for the groups that repeat on a known period.
+    """
+    import numpy as np
+
+    keys = list(groups)
+    if not keys:
+        return {}
+
+    lengths = np.array([len(groups[k]["days"]) for k in keys])
+    days = np.concatenate([np.asarray(groups[k]["days"], dtype=float) for k in keys])
+    group_ids = np.repeat(np.arange(len(keys)), lengths)
+
+    # Gaps between consecutive occurrences of the same group
+    same_group = group_ids[1:] == group_ids[:-1]
+    gaps = np.diff(days)[same_group]
+    gap_groups = group_ids[1:][same_group]
+
+    n = len(keys)
+    gap_counts = np.bincount(gap_groups, minlength=n)
+    mean_gap = np.bincount(gap_groups, weights=gaps, minlength=n) / np.maximum(gap_counts, 1)
+    max_deviation = np.zeros(n)
+    np.maximum.at(max_deviation, gap_groups, np.abs(gaps - mean_gap[gap_groups]))
+    last_days = days[np.cumsum(lengths) - 1]
+
+    periods = np.full(n, "", dtype=object)
+    for name, (nominal, tolerance) in PERIODS.items():
+        matches = (
+            (lengths >= MIN_OCCURRENCES)
+            & (np.abs(mean_gap - nominal) <= tolerance)
+            & (max_deviation <= tolerance)
+        )
+        periods[matches] = name
+
+    return {
+        keys[i]: RecurringSeries(
+            accountId=keys[i][0],
+            description=groups[keys[i]]["description"],
+            amount=groups[keys[i]]["amount"],
+            period=periods[i],
+            lastDate=date.fromordinal(int(last_days[i])),
+            count=int(lengths[i]),
+        )
+        for i in np.flatnonzero(periods != "")
+    }
+
+class _UserHistory:
+    def __init__(self):
+        self.groups = {}
+        self.series = {}
+        self.loaded_at = time.monotonic()
+
+    def add(self, transactions):
+        touched = set()
+        for t in transactions:
+            key = series_key(t)
+            group = self.groups.setdefault(key, {"days": [], "description": t.description, "amount": t.amount})
+            day = t.date.date().toordinal()
+            if not group["days"] or day >= group["days"][-1]:
+                group["days"].append(day)
+                # Project with the most recent description and amount
+                group["description"] = t.description
+                group["amount"] = t.amount
+            else:
+                insort(group["days"], day)
+            touched.add(key)
+        return touched
+
+    def redetect(self, keys):
+        for key in keys:
+            self.series.pop(key, None)
+        self.series.update(detect_series({key: self.groups[key] for key in keys}))
+
+_histories = OrderedDict()
+
+# Bumped on every write, a history loaded while it changed is already stale
+_generations = defaultdict(int)
+
+async def get_series(user_id):
+    history = _histories.get(user_id)
+    if history is None or time.monotonic() - history.loaded_at > CACHE_TTL_SECONDS:
+        generation = _generations.get(user_id, 0)
+        transactions = await prisma.transaction.find_many(where={"userId": user_id}, order={"date": "asc"})
+        history = _UserHistory()
+        history.redetect(history.add(transactions))
+        if _generations.get(user_id, 0) != generation:
+            # Serve it to this request only, the next read loads again
+            return list(history.series.values())
+        _histories[user_id] = history
+        if len(_histories) > MAX_CACHED_USERS:
+            _histories.popitem(last=False)
+    _histories.move_to_end(user_id)
+    return list(history.series.values())
+
+def record_transactions(user_id, transactions):
+    """Fold newly created transactions into a cached history, re-detecting only the series they touch."""
+    _generations[user_id] += 1
+    history = _histories.get(user_id)
+    if history is not None:
+        history.redetect(history.add(transactions))
+
+def invalidate(user_id):
+    """Drop a cached history after edits or deletes, it is rebuilt on the next read."""
+    _generations[user_id] += 1
+    _histories.pop(user_id, None)
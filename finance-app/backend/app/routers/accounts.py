@@ -3,6 +3,7 @@ from typing import List
 from ..database import prisma
 from ..models import AccountCreate, AccountResponse, AccountUpdate
 from ..dependencies import get_current_user
+from ..fx import check_currency
 
 router = APIRouter(prefix="/accounts", tags=["accounts"])
 
@@ -12,11 +13,17 @@ async def get_accounts(user=Depends(get_current_user)):
 
 @router.post("/", response_model=AccountResponse)
 async def create_account(account: AccountCreate, user=Depends(get_current_user)):
+    try:
+        check_currency(account.currency)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
     return await prisma.account.create(
         data={
             "name": account.name,
             "type": account.type,
             "balance": account.balance,
+            "currency": account.currency,
             "userId": user.id
         }
     )
@@ -35,6 +42,23 @@ async def update_account(account_id: str, account: AccountUpdate, user=Depends(g
     existing_account = await prisma.account.find_first(where={"id": account_id, "userId": user.id})
     if not existing_account:
         raise HTTPException(status_code=404, detail="Account not found")
+
+    if account.currency is not None and account.currency != existing_account.currency:
+        try:
+            check_currency(account.currency)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+        # Past amounts are in the old currency, changing it would relabel the whole ledger
+        has_history = (
+            await prisma.transaction.find_first(where={"accountId": account_id})
+            or await prisma.stock.find_first(where={"accountId": account_id})
+        )
+        if has_history:
+            raise HTTPException(
+                status_code=400,
+                detail="Cannot change the currency of an account with transactions or stocks"
+            )
     
     update_data = account.dict(exclude_unset=True)
     return await prisma.account.update(
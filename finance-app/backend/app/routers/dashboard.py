@@ -1,40 +1,81 @@
 from datetime import datetime
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException
 from ..database import prisma
 from ..dependencies import get_current_user
+from ..ratelimit import admission
+from ..fx import BASE_CURRENCY, RateTable, check_currency
 
 router = APIRouter(prefix="/dashboard", tags=["dashboard"])
 
-@router.get("/summary")
-async def get_dashboard_summary(user=Depends(get_current_user)):
+@router.get("/summary", dependencies=[Depends(admission("analytics"))])
+async def get_dashboard_summary(currency: str = BASE_CURRENCY, user=Depends(get_current_user)):
+    import numpy as np
+
+    try:
+        check_currency(currency)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
     # Get current month range
     now = datetime.now()
     start_of_month = datetime(now.year, now.month, 1)
+    start_of_year = datetime(now.year, 1, 1)
     
     # Fetch accounts
     accounts = await prisma.account.find_many(where={"userId": user.id})
-    total_balance = sum(acc.balance for acc in accounts)
-    
-    # Fetch transactions for current month
-    monthly_transactions = await prisma.transaction.find_many(
+    account_currencies = {acc.id: acc.currency for acc in accounts}
+
+    # Fetch transactions for the current year, the monthly stats are a subset
+    yearly_transactions = await prisma.transaction.find_many(
         where={
             "userId": user.id,
             "date": {
-                "gte": start_of_month
+                "gte": start_of_year
             }
         },
         include={"category": True}
     )
-    
+
+    # Budgets have no currency of their own and are kept in the base currency
+    budgets = await prisma.budget.find_many(where={"userId": user.id, "year": now.year})
+    budget_currencies = {BASE_CURRENCY} if budgets else set()
+
+    # Transactions are in their account's currency, convert everything in one pass
+    rates = await RateTable.load(
+        set(account_currencies.values()) | budget_currencies | {currency}, start_of_year.date(), now.date()
+    )
+    total_balance = float(rates.convert_on(
+        [acc.balance for acc in accounts],
+        [acc.currency for acc in accounts],
+        now.date(),
+        currency
+    ).sum())
+
+    days = np.array([t.date.date() for t in yearly_transactions], dtype="datetime64[D]")
+    amounts = rates.convert(
+        [t.amount for t in yearly_transactions],
+        [account_currencies.get(t.accountId, currency) for t in yearly_transactions],
+        days,
+        currency
+    )
+    months = np.array([t.date.month for t in yearly_transactions], dtype=int)
+    category_types = np.array([t.category.type if t.category else "" for t in yearly_transactions], dtype=object)
+    is_income = category_types == "INCOME"
+    is_expense = category_types == "EXPENSE"
+    this_month = days >= np.datetime64(start_of_month.date(), "D")
+
     # Calculate monthly stats
-    monthly_expenses = sum(t.amount for t in monthly_transactions if t.category and t.category.type == "EXPENSE")
-    monthly_income = sum(t.amount for t in monthly_transactions if t.category and t.category.type == "INCOME")
+    monthly_expenses = float(amounts[is_expense & this_month].sum())
+    monthly_income = float(amounts[is_income & this_month].sum())
     
-    # Fetch budgets
-    budgets = await prisma.budget.find_many(where={"userId": user.id, "year": now.year})
-    total_budget = sum(b.amount for b in budgets)
+    total_budget = float(rates.convert_on(
+        [b.amount for b in budgets],
+        [BASE_CURRENCY] * len(budgets),
+        now.date(),
+        currency
+    ).sum())
     
-    # Recent transactions
+    # Recent transactions, left in their account's currency and labelled with it
     recent_transactions = await prisma.transaction.find_many(
         where={"userId": user.id},
         take=5,
@@ -43,35 +84,27 @@ async def get_dashboard_summary(user=Depends(get_current_user)):
     )
     
     # Monthly Stats for Chart
-    start_of_year = datetime(now.year, 1, 1)
-    yearly_transactions = await prisma.transaction.find_many(
-        where={
-            "userId": user.id,
-            "date": {
-                "gte": start_of_year
-            }
-        },
-        include={"category": True}
-    )
+    income_by_month = np.bincount(months, weights=np.where(is_income, amounts, 0.0), minlength=13)
+    expenses_by_month = np.bincount(months, weights=np.where(is_expense, np.abs(amounts), 0.0), minlength=13)
 
     monthly_stats = []
     for i in range(1, 13):
         month_name = datetime(now.year, i, 1).strftime("%b")
-        month_txs = [t for t in yearly_transactions if t.date.month == i]
-        income = sum(t.amount for t in month_txs if t.category and t.category.type == "INCOME")
-        expenses = sum(abs(t.amount) for t in month_txs if t.category and t.category.type == "EXPENSE")
         monthly_stats.append({
             "month": month_name,
-            "income": income,
-            "expenses": expenses
+            "income": float(income_by_month[i]),
+            "expenses": float(expenses_by_month[i])
         })
 
     return {
+        "currency": currency,
         "totalBalance": total_balance,
         "accountCount": len(accounts),
         "monthlyExpenses": monthly_expenses,
         "monthlyIncome": monthly_income,
         "totalBudget": total_budget,
-        "recentTransactions": recent_transactions,
+        "recentTransactions": [
+            {**t.dict(), "currency": account_currencies.get(t.accountId)} for t in recent_transactions
+        ],
         "monthlyStats": monthly_stats
     }
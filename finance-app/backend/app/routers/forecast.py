@@ -0,0 +1,47 @@
+from datetime import datetime, timedelta
+from fastapi import APIRouter, Depends, Query
+from ..database import prisma
+from ..models import ForecastResponse
+from ..dependencies import get_current_user
+from ..ratelimit import admission
+from ..recurring import get_series
+
+router = APIRouter(prefix="/forecast", tags=["forecast"])
+
+@router.get("", response_model=ForecastResponse, dependencies=[Depends(admission("analytics"))])
+async def get_forecast(days: int = Query(30, ge=1, le=365), user=Depends(get_current_user)):
+    today = datetime.now().date()
+    end = today + timedelta(days=days)
+
+    accounts = await prisma.account.find_many(where={"userId": user.id})
+    series = [s for s in await get_series(user.id) if s.is_active(today)]
+
+    forecasts = []
+    for account in accounts:
+        events = sorted(
+            ((day, s) for s in series if s.accountId == account.id for day in s.occurrences(today, end)),
+            key=lambda event: event[0]
+        )
+
+        balance = account.balance
+        upcoming = []
+        for day, s in events:
+            balance += s.amount
+            upcoming.append({
+                "date": day,
+                "description": s.description,
+                "amount": s.amount,
+                "period": s.period,
+                "balance": balance
+            })
+
+        forecasts.append({
+            "accountId": account.id,
+            "name": account.name,
+            "currency": account.currency,
+            "currentBalance": account.balance,
+            "projectedBalance": balance,
+            "upcoming": upcoming
+        })
+
+    return {"days": days, "accounts": forecasts}
@@ -1,9 +1,16 @@
 from fastapi import APIRouter, Depends, HTTPException
-from typing import List
+from typing import List, Optional
+from datetime import datetime
 from ..database import prisma
-from ..models import StockCreate, StockResponse, StockTransactionCreate, StockTransactionResponse
+from ..models import (
+    StockCreate, StockResponse, StockTransactionCreate, StockTransactionResponse,
+    TaxLotResponse, RealizedGainsResponse, PortfolioResponse, LotMethod
+)
 from ..dependencies import get_current_user
-import yfinance as yf
+from ..lots import LotMatcher, OpenLot, InsufficientSharesError, lot_order, EPSILON, LOT_PAGE_SIZE
+from ..fx import BASE_CURRENCY, RateTable, check_currency
+from ..ratelimit import admission
+from ..recurring import record_transactions
 
 router = APIRouter(prefix="/stocks", tags=["stocks"])
 
@@ -19,7 +26,15 @@ async def create_stock(stock: StockCreate, user=Depends(get_current_user)):
     account = await prisma.account.find_unique(where={"id": stock.accountId})
     if not account or account.userId != user.id:
         raise HTTPException(status_code=404, detail="Account not found")
+
+    try:
+        check_currency(stock.currency)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
+    # yfinance is heavy, load it on first use (see app.startup)
+    import yfinance as yf
+
     # Initial fetch of current price
     try:
         ticker = yf.Ticker(stock.symbol)
@@ -27,19 +42,38 @@ async def create_stock(stock: StockCreate, user=Depends(get_current_user)):
     except Exception:
         current_price = None
 
-    return await prisma.stock.create(
+    new_stock = await prisma.stock.create(
         data={
             "symbol": stock.symbol,
             "quantity": stock.quantity,
             "averagePrice": stock.averagePrice,
             "currentPrice": current_price,
+            "currency": stock.currency,
+            "lotMethod": stock.lotMethod,
             "accountId": stock.accountId,
             "userId": user.id
         }
     )
 
-@router.post("/sync")
+    # Opening position becomes the first tax lot
+    if stock.quantity > 0:
+        await prisma.taxlot.create(
+            data={
+                "quantity": stock.quantity,
+                "remainingQuantity": stock.quantity,
+                "costPerShare": stock.averagePrice,
+                "acquiredAt": new_stock.createdAt,
+                "stockId": new_stock.id,
+                "userId": user.id
+            }
+        )
+
+    return new_stock
+
+@router.post("/sync", dependencies=[Depends(admission("market_data"))])
 async def sync_stocks(user=Depends(get_current_user)):
+    import yfinance as yf
+
     stocks = await prisma.stock.find_many(where={"userId": user.id})
     updated_count = 0
     
@@ -63,6 +97,84 @@ async def sync_stocks(user=Depends(get_current_user)):
     await prisma.stock.delete(where={"id": stock_id})
     return {"message": "Stock deleted"}
 
+@router.get("/portfolio", response_model=PortfolioResponse)
+async def get_portfolio(currency: str = BASE_CURRENCY, user=Depends(get_current_user)):
+    import numpy as np
+
+    try:
+        check_currency(currency)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    stocks = await prisma.stock.find_many(where={"userId": user.id})
+    today = datetime.now().date()
+    rates = await RateTable.load({s.currency for s in stocks} | {currency}, today, today)
+
+    currencies = [s.currency for s in stocks]
+    quantities = np.array([s.quantity for s in stocks], dtype=float)
+    prices = np.array([s.currentPrice if s.currentPrice is not None else s.averagePrice for s in stocks], dtype=float)
+    average_prices = np.array([s.averagePrice for s in stocks], dtype=float)
+
+    market_value = float(rates.convert_on(quantities * prices, currencies, today, currency).sum())
+    cost_basis = float(rates.convert_on(quantities * average_prices, currencies, today, currency).sum())
+    return {
+        "currency": currency,
+        "marketValue": market_value,
+        "costBasis": cost_basis,
+        "unrealizedGain": market_value - cost_basis
+    }
+
+@router.get("/realized-gains", response_model=RealizedGainsResponse)
+async def get_realized_gains(
+    year: Optional[int] = None,
+    currency: str = BASE_CURRENCY,
+    user=Depends(get_current_user)
+):
+    try:
+        check_currency(currency)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    where = {"userId": user.id}
+    if year is not None:
+        where["date"] = {"gte": datetime(year, 1, 1), "lt": datetime(year + 1, 1, 1)}
+
+    # One row per stock and sale date, so totals can be converted at the rate of the sale
+    groups = await prisma.realizedgain.group_by(
+        ["stockId", "date"],
+        where=where,
+        sum={"quantity": True, "proceeds": True, "costBasis": True, "gain": True}
+    )
+    stocks = {s.id: s for s in await prisma.stock.find_many(where={"userId": user.id})}
+
+    fields = ("quantity", "proceeds", "costBasis", "gain")
+    summaries = {}
+    for group in groups:
+        stock = stocks[group["stockId"]]
+        summary = summaries.setdefault(stock.id, {
+            "stockId": stock.id,
+            "symbol": stock.symbol,
+            "currency": stock.currency,
+            **{field: 0.0 for field in fields}
+        })
+        for field in fields:
+            summary[field] += group["_sum"][field] or 0.0
+
+    totals = {"proceeds": 0.0, "costBasis": 0.0, "gain": 0.0}
+    if groups:
+        days = [datetime.fromisoformat(str(group["date"]).replace("Z", "+00:00")).date() for group in groups]
+        currencies = [stocks[group["stockId"]].currency for group in groups]
+        rates = await RateTable.load(set(currencies) | {currency}, min(days), max(days))
+        for field in totals:
+            amounts = [group["_sum"][field] or 0.0 for group in groups]
+            totals[field] = float(rates.convert(amounts, currencies, days, currency).sum())
+
+    return {
+        "currency": currency,
+        **totals,
+        "stocks": list(summaries.values())
+    }
+
 @router.get("/{stock_id}", response_model=StockResponse)
 async def get_stock_details(stock_id: str, user=Depends(get_current_user)):
     stock = await prisma.stock.find_first(
@@ -80,6 +192,50 @@ async def get_stock_transactions(stock_id: str, user=Depends(get_current_user)):
         order={"date": "desc"}
     )
 
+@router.get("/{stock_id}/lots", response_model=List[TaxLotResponse])
+async def get_stock_lots(stock_id: str, include_closed: bool = False, user=Depends(get_current_user)):
+    where = {"stockId": stock_id, "userId": user.id}
+    if not include_closed:
+        where["open"] = True
+    return await prisma.taxlot.find_many(where=where, order=lot_order("FIFO"))
+
+class _ConcurrentUpdateError(Exception):
+    pass
+
+async def _ensure_opening_lot(client, stock, user_id):
+    # Positions created before lots were tracked get an opening lot at the average price
+    if stock.quantity > EPSILON and not await client.taxlot.find_first(where={"stockId": stock.id}):
+        await client.taxlot.create(
+            data={
+                "quantity": stock.quantity,
+                "remainingQuantity": stock.quantity,
+                "costPerShare": stock.averagePrice,
+                "acquiredAt": stock.createdAt,
+                "stockId": stock.id,
+                "userId": user_id
+            }
+        )
+
+async def _match_sale(client, stock, quantity, sold_at):
+    # Read open lots in matching order a page at a time, until the sale is covered.
+    # Dates are user supplied, a backdated sale can only relieve lots held by then.
+    matcher = LotMatcher(quantity, stock.lotMethod, stock.averagePrice)
+    skip = 0
+    while not matcher.done:
+        lots = await client.taxlot.find_many(
+            where={"stockId": stock.id, "open": True, "acquiredAt": {"lte": sold_at}},
+            order=lot_order(stock.lotMethod),
+            take=LOT_PAGE_SIZE,
+            skip=skip
+        )
+        if not lots:
+            raise InsufficientSharesError(
+                f"Cannot sell {quantity} shares, lots held on {sold_at.date()} do not cover the sale"
+            )
+        matcher.consume(OpenLot(l.id, l.remainingQuantity, l.costPerShare) for l in lots)
+        skip += len(lots)
+    return matcher
+
 @router.post("/{stock_id}/transactions", response_model=StockTransactionResponse)
 async def create_stock_transaction(
     stock_id: str, 
@@ -93,95 +249,173 @@ async def create_stock_transaction(
     if not stock:
         raise HTTPException(status_code=404, detail="Stock not found")
 
-    # 1. Create Stock Transaction
-    stock_tx = await prisma.stocktransaction.create(
-        data={
-            "type": transaction.type,
-            "quantity": transaction.quantity,
-            "price": transaction.price,
-            "amount": transaction.amount,
-            "date": transaction.date,
-            "stockId": stock_id,
-            "userId": user.id
-        }
-    )
-
-    # 2. Update Stock Quantity & Avg Price
-    new_quantity = stock.quantity
-    new_avg_price = stock.averagePrice
-
-    if transaction.type == "BUY":
-        total_cost = (stock.quantity * stock.averagePrice) + transaction.amount
-        new_quantity = stock.quantity + transaction.quantity
-        if new_quantity > 0:
-            new_avg_price = total_cost / new_quantity
-        
-        # Deduct from Account
-        await prisma.account.update(
-            where={"id": stock.accountId},
-            data={"balance": {"decrement": transaction.amount}}
-        )
-        
-        # Create Expense Transaction
-        await prisma.transaction.create(
-            data={
-                "date": transaction.date,
-                "amount": -transaction.amount,
-                "description": f"Buy {stock.symbol} ({transaction.quantity} shares)",
-                "accountId": stock.accountId,
-                "userId": user.id,
-                "categoryId": None # Optional: could link to an 'Investment' category if exists
-            }
+    if transaction.type in ("BUY", "SELL") and (not transaction.quantity or transaction.quantity <= 0):
+        raise HTTPException(status_code=400, detail="Quantity must be positive")
+    if transaction.type == "SELL" and transaction.quantity > stock.quantity + EPSILON:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Cannot sell {transaction.quantity} shares, only {stock.quantity} held"
         )
 
-    elif transaction.type == "SELL":
-        new_quantity = stock.quantity - transaction.quantity
-        # Avg price doesn't change on sell, only realized gain/loss happens
-        
-        # Add to Account
-        await prisma.account.update(
-            where={"id": stock.accountId},
-            data={"balance": {"increment": transaction.amount}}
-        )
+    # Lots and gains stay in the stock's currency, the cash leg is in the account's
+    cash_amount = transaction.amount
+    if stock.currency != stock.account.currency:
+        trade_day = transaction.date.date()
+        rates = await RateTable.load({stock.currency, stock.account.currency}, trade_day, trade_day)
+        cash_amount = float(rates.convert_on(
+            [transaction.amount], [stock.currency], trade_day, stock.account.currency
+        )[0])
 
-        # Create Income Transaction
-        await prisma.transaction.create(
-            data={
-                "date": transaction.date,
-                "amount": transaction.amount,
-                "description": f"Sell {stock.symbol} ({transaction.quantity} shares)",
-                "accountId": stock.accountId,
-                "userId": user.id,
-                "categoryId": None
-            }
-        )
+    # Everything below is one database transaction. The stock row and each matched
+    # lot are updated only if they still hold the values read, so a concurrent
+    # trade on the same stock rolls this one back instead of double-counting shares.
+    try:
+        async with prisma.tx() as tx:
+            # 1. Create Stock Transaction
+            stock_tx = await tx.stocktransaction.create(
+                data={
+                    "type": transaction.type,
+                    "quantity": transaction.quantity,
+                    "price": transaction.price,
+                    "amount": transaction.amount,
+                    "date": transaction.date,
+                    "stockId": stock_id,
+                    "userId": user.id
+                }
+            )
 
-    elif transaction.type == "DIVIDEND":
-        # Add to Account
-        await prisma.account.update(
-            where={"id": stock.accountId},
-            data={"balance": {"increment": transaction.amount}}
-        )
+            # Backfill before any new lot is written, "no lots yet" marks a legacy position
+            if transaction.type in ("BUY", "SELL"):
+                await _ensure_opening_lot(tx, stock, user.id)
 
-        # Create Income Transaction
-        await prisma.transaction.create(
-            data={
-                "date": transaction.date,
-                "amount": transaction.amount,
-                "description": f"Dividend {stock.symbol}",
-                "accountId": stock.accountId,
-                "userId": user.id,
-                "categoryId": None
-            }
-        )
+            # 2. Update Stock Quantity & Avg Price
+            cash_transaction = None
+            new_quantity = stock.quantity
+            new_avg_price = stock.averagePrice
 
-    # Update Stock
-    await prisma.stock.update(
-        where={"id": stock_id},
-        data={
-            "quantity": new_quantity,
-            "averagePrice": new_avg_price
-        }
-    )
+            if transaction.type == "BUY":
+                total_cost = (stock.quantity * stock.averagePrice) + transaction.amount
+                new_quantity = stock.quantity + transaction.quantity
+                if new_quantity > 0:
+                    new_avg_price = total_cost / new_quantity
+
+                # Open a new tax lot
+                await tx.taxlot.create(
+                    data={
+                        "quantity": transaction.quantity,
+                        "remainingQuantity": transaction.quantity,
+                        "costPerShare": transaction.amount / transaction.quantity,
+                        "acquiredAt": transaction.date,
+                        "stockId": stock_id,
+                        "transactionId": stock_tx.id,
+                        "userId": user.id
+                    }
+                )
+
+                # Deduct from Account
+                await tx.account.update(
+                    where={"id": stock.accountId},
+                    data={"balance": {"decrement": cash_amount}}
+                )
+
+                # Create Expense Transaction
+                cash_transaction = await tx.transaction.create(
+                    data={
+                        "date": transaction.date,
+                        "amount": -cash_amount,
+                        "description": f"Buy {stock.symbol} ({transaction.quantity} shares)",
+                        "accountId": stock.accountId,
+                        "userId": user.id,
+                        "categoryId": None # Optional: could link to an 'Investment' category if exists
+                    }
+                )
+
+            elif transaction.type == "SELL":
+                matcher = await _match_sale(tx, stock, transaction.quantity, transaction.date)
+
+                new_quantity = stock.quantity - transaction.quantity
+                # The average only moves when specific lots are relieved
+                if matcher.method != LotMethod.AVERAGE and new_quantity > EPSILON:
+                    new_avg_price = (stock.quantity * stock.averagePrice - matcher.cost_basis) / new_quantity
+
+                # Close matched lots and record realized gains, proceeds split by quantity
+                for match in matcher.matches:
+                    updated = await tx.taxlot.update_many(
+                        where={"id": match.lot_id, "remainingQuantity": match.expected},
+                        data={"remainingQuantity": match.remaining, "open": match.remaining > EPSILON}
+                    )
+                    if updated != 1:
+                        raise _ConcurrentUpdateError()
+
+                    proceeds = transaction.amount * match.quantity / transaction.quantity
+                    await tx.realizedgain.create(
+                        data={
+                            "quantity": match.quantity,
+                            "proceeds": proceeds,
+                            "costBasis": match.cost_basis,
+                            "gain": proceeds - match.cost_basis,
+                            "method": matcher.method.value,
+                            "date": transaction.date,
+                            "lotId": match.lot_id,
+                            "transactionId": stock_tx.id,
+                            "stockId": stock_id,
+                            "userId": user.id
+                        }
+                    )
+
+                # Add to Account
+                await tx.account.update(
+                    where={"id": stock.accountId},
+                    data={"balance": {"increment": cash_amount}}
+                )
+
+                # Create Income Transaction
+                cash_transaction = await tx.transaction.create(
+                    data={
+                        "date": transaction.date,
+                        "amount": cash_amount,
+                        "description": f"Sell {stock.symbol} ({transaction.quantity} shares)",
+                        "accountId": stock.accountId,
+                        "userId": user.id,
+                        "categoryId": None
+                    }
+                )
+
+            elif transaction.type == "DIVIDEND":
+                # Add to Account
+                await tx.account.update(
+                    where={"id": stock.accountId},
+                    data={"balance": {"increment": cash_amount}}
+                )
+
+                # Create Income Transaction
+                cash_transaction = await tx.transaction.create(
+                    data={
+                        "date": transaction.date,
+                        "amount": cash_amount,
+                        "description": f"Dividend {stock.symbol}",
+                        "accountId": stock.accountId,
+                        "userId": user.id,
+                        "categoryId": None
+                    }
+                )
+
+            # Update Stock, only if no other trade changed it since it was read
+            updated = await tx.stock.update_many(
+                where={"id": stock_id, "quantity": stock.quantity, "averagePrice": stock.averagePrice},
+                data={
+                    "quantity": new_quantity,
+                    "averagePrice": new_avg_price
+                }
+            )
+            if updated != 1:
+                raise _ConcurrentUpdateError()
+    except InsufficientSharesError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except _ConcurrentUpdateError:
+        raise HTTPException(status_code=409, detail="Stock was modified by another request, please retry")
+
+    if cash_transaction:
+        record_transactions(user.id, [cash_transaction])
 
     return stock_tx
@@ -1,13 +1,22 @@
 from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
 from typing import List
+from collections import defaultdict
+from uuid import uuid4
 from ..database import prisma
-from ..models import TransactionCreate, TransactionResponse, TransactionUpdate, TransferRequest
+from ..models import (
+    TransactionCreate, TransactionResponse, TransactionUpdate, TransferRequest,
+    BatchOperationType, TransactionBatchRequest, TransactionBatchResponse, TransactionBatchResult
+)
 from ..dependencies import get_current_user
-import pandas as pd
+from ..fx import RateTable
+from ..recurring import record_transactions, invalidate
 from io import BytesIO
 
 router = APIRouter(prefix="/transactions", tags=["transactions"])
 
+MAX_BATCH_OPERATIONS = 10000
+REQUIRED_TRANSACTION_FIELDS = ("date", "amount", "description", "accountId")
+
 @router.post("/transfer")
 async def transfer_funds(transfer: TransferRequest, user=Depends(get_current_user)):
     # Verify accounts
@@ -19,6 +28,15 @@ async def transfer_funds(transfer: TransferRequest, user=Depends(get_current_use
     if not to_account or to_account.userId != user.id:
         raise HTTPException(status_code=404, detail="Destination account not found")
 
+    # The amount is in the source account's currency, credit its value at the transfer date
+    incoming_amount = transfer.amount
+    if from_account.currency != to_account.currency:
+        transfer_day = transfer.date.date()
+        rates = await RateTable.load({from_account.currency, to_account.currency}, transfer_day, transfer_day)
+        incoming_amount = float(rates.convert_on(
+            [transfer.amount], [from_account.currency], transfer_day, to_account.currency
+        )[0])
+
     # Update balances
     await prisma.account.update(
         where={"id": transfer.fromAccountId},
@@ -26,12 +44,12 @@ async def transfer_funds(transfer: TransferRequest, user=Depends(get_current_use
     )
     await prisma.account.update(
         where={"id": transfer.toAccountId},
-        data={"balance": to_account.balance + transfer.amount}
+        data={"balance": to_account.balance + incoming_amount}
     )
 
     # Create transactions
     # 1. Expense from source
-    await prisma.transaction.create(
+    outgoing = await prisma.transaction.create(
         data={
             "date": transfer.date,
             "amount": -transfer.amount,
@@ -42,18 +60,149 @@ async def transfer_funds(transfer: TransferRequest, user=Depends(get_current_use
     )
 
     # 2. Income to destination
-    await prisma.transaction.create(
+    incoming = await prisma.transaction.create(
         data={
             "date": transfer.date,
-            "amount": transfer.amount,
+            "amount": incoming_amount,
             "description": f"Transfer from {from_account.name}: {transfer.description}",
             "accountId": transfer.toAccountId,
             "userId": user.id
         }
     )
 
+    record_transactions(user.id, [outgoing, incoming])
     return {"message": "Transfer successful"}
 
+# Admitted by AdmissionMiddleware before the body is read, see ratelimit.BODY_ADMISSION_ROUTES
+@router.post("/batch", response_model=TransactionBatchResponse)
+async def batch_transactions(batch: TransactionBatchRequest, user=Depends(get_current_user)):
+    operations = batch.operations
+    if not operations:
+        raise HTTPException(status_code=400, detail="No operations provided")
+    if len(operations) > MAX_BATCH_OPERATIONS:
+        raise HTTPException(status_code=400, detail=f"Batch exceeds {MAX_BATCH_OPERATIONS} operations")
+
+    # Load everything the batch references up front, one query per table
+    target_ids = list({op.id for op in operations if op.id})
+    existing = {}
+    if target_ids:
+        rows = await prisma.transaction.find_many(where={"id": {"in": target_ids}, "userId": user.id})
+        existing = {t.id: t for t in rows}
+
+    payloads = [op.data.dict(exclude_unset=True) if op.data else {} for op in operations]
+
+    # Accounts moved to or from, with their currencies
+    account_ids = list(
+        {data["accountId"] for data in payloads if data.get("accountId")}
+        | {t.accountId for t in existing.values()}
+    )
+    accounts = {}
+    if account_ids:
+        rows = await prisma.account.find_many(where={"id": {"in": account_ids}, "userId": user.id})
+        accounts = {a.id: a.currency for a in rows}
+
+    category_ids = list({data["categoryId"] for data in payloads if data.get("categoryId")})
+    categories = set()
+    if category_ids:
+        rows = await prisma.category.find_many(where={"id": {"in": category_ids}, "userId": user.id})
+        categories = {c.id for c in rows}
+
+    # Validate the whole batch before writing anything
+    results = []
+    seen_ids = set()
+    for index, (op, data) in enumerate(zip(operations, payloads)):
+        error = None
+        if op.op == BatchOperationType.CREATE:
+            missing = [f for f in REQUIRED_TRANSACTION_FIELDS if data.get(f) is None]
+            if op.id:
+                error = "id must not be set for CREATE"
+            elif missing:
+                error = f"Missing fields: {', '.join(missing)}"
+        else:
+            if not op.id:
+                error = "Transaction id required"
+            elif op.id in seen_ids:
+                error = "Transaction referenced more than once"
+            elif op.id not in existing:
+                error = "Transaction not found"
+            elif op.op == BatchOperationType.UPDATE:
+                nulls = [f for f in REQUIRED_TRANSACTION_FIELDS if f in data and data[f] is None]
+                if not data:
+                    error = "No fields to update"
+                elif nulls:
+                    error = f"Fields cannot be null: {', '.join(nulls)}"
+            seen_ids.add(op.id)
+
+        if error is None and op.op != BatchOperationType.DELETE:
+            if data.get("accountId") and data["accountId"] not in accounts:
+                error = "Account not found"
+            elif (
+                op.op == BatchOperationType.UPDATE
+                and data.get("accountId")
+                and accounts[data["accountId"]] != accounts.get(existing[op.id].accountId)
+            ):
+                # Amounts are in the account's currency, moving would relabel them
+                error = "Cannot move a transaction to an account in another currency"
+            elif data.get("categoryId") and data["categoryId"] not in categories:
+                error = "Category not found"
+
+        results.append(TransactionBatchResult(
+            index=index,
+            op=op.op,
+            id=op.id,
+            status="ERROR" if error else "OK",
+            detail=error
+        ))
+
+    if any(r.status == "ERROR" for r in results):
+        raise HTTPException(status_code=422, detail=[r.dict() for r in results])
+
+    # Net balance changes per account and group identical updates together
+    balance_deltas = defaultdict(float)
+    creates = []
+    updates = defaultdict(list)
+    deletes = []
+    for result, op, data in zip(results, operations, payloads):
+        if op.op == BatchOperationType.CREATE:
+            result.id = str(uuid4())
+            creates.append({**data, "id": result.id, "userId": user.id})
+            balance_deltas[data["accountId"]] += data["amount"]
+        elif op.op == BatchOperationType.UPDATE:
+            old = existing[op.id]
+            new_account_id = data.get("accountId", old.accountId)
+            new_amount = data.get("amount", old.amount)
+            if new_account_id != old.accountId or new_amount != old.amount:
+                balance_deltas[old.accountId] -= old.amount
+                balance_deltas[new_account_id] += new_amount
+            updates[tuple(sorted(data.items()))].append(op.id)
+        else:
+            old = existing[op.id]
+            balance_deltas[old.accountId] -= old.amount
+            deletes.append(op.id)
+
+    # Commit everything in a single database transaction
+    async with prisma.batch_() as batcher:
+        for data in creates:
+            batcher.transaction.create(data=data)
+        for fields, ids in updates.items():
+            batcher.transaction.update_many(where={"id": {"in": ids}}, data=dict(fields))
+        if deletes:
+            batcher.transaction.delete_many(where={"id": {"in": deletes}})
+        for account_id, delta in balance_deltas.items():
+            if delta:
+                batcher.account.update(
+                    where={"id": account_id},
+                    data={"balance": {"increment": delta}}
+                )
+    invalidate(user.id)
+
+    return {
+        "created": len(creates),
+        "updated": sum(len(ids) for ids in updates.values()),
+        "deleted": len(deletes),
+        "results": results
+    }
+
 @router.get("/", response_model=List[TransactionResponse])
 async def get_transactions(user=Depends(get_current_user)):
     return await prisma.transaction.find_many(
@@ -79,7 +228,7 @@ async def create_transaction(transaction: TransactionCreate, user=Depends(get_cu
         data={"balance": new_balance}
     )
 
-    return await prisma.transaction.create(
+    new_transaction = await prisma.transaction.create(
         data={
             "date": transaction.date,
             "amount": transaction.amount,
@@ -89,12 +238,18 @@ async def create_transaction(transaction: TransactionCreate, user=Depends(get_cu
             "userId": user.id
         }
     )
+    record_transactions(user.id, [new_transaction])
+    return new_transaction
 
+# Admitted by AdmissionMiddleware before the upload is read, see ratelimit.BODY_ADMISSION_ROUTES
 @router.post("/import")
 async def import_transactions(file: UploadFile = File(...), account_id: str = "", user=Depends(get_current_user)):
     if not account_id:
          raise HTTPException(status_code=400, detail="Account ID required")
     
+    # pandas is heavy, load it on first import request (see app.startup)
+    import pandas as pd
+
     contents = await file.read()
     df = pd.read_excel(BytesIO(contents))
     
@@ -117,6 +272,7 @@ async def import_transactions(file: UploadFile = File(...), account_id: str = ""
             print(f"Error importing row: {e}")
             continue
             
+    invalidate(user.id)
     return {"message": f"Imported {count} transactions"}
 
 @router.delete("/{transaction_id}")
@@ -135,6 +291,7 @@ async def delete_transaction(transaction_id: str, user=Depends(get_current_user)
         )
     
     await prisma.transaction.delete(where={"id": transaction_id})
+    invalidate(user.id)
     return {"message": "Transaction deleted"}
 
 @router.put("/{transaction_id}", response_model=TransactionResponse)
@@ -142,6 +299,17 @@ async def update_transaction(transaction_id: str, transaction: TransactionUpdate
     existing_transaction = await prisma.transaction.find_first(where={"id": transaction_id, "userId": user.id})
     if not existing_transaction:
         raise HTTPException(status_code=404, detail="Transaction not found")
+
+    if transaction.accountId is not None and transaction.accountId != existing_transaction.accountId:
+        accounts = await prisma.account.find_many(
+            where={"id": {"in": [existing_transaction.accountId, transaction.accountId]}, "userId": user.id}
+        )
+        currencies = {a.id: a.currency for a in accounts}
+        if transaction.accountId not in currencies:
+            raise HTTPException(status_code=404, detail="Account not found")
+        # Amounts are in the account's currency, moving would relabel them
+        if currencies[transaction.accountId] != currencies.get(existing_transaction.accountId):
+            raise HTTPException(status_code=400, detail="Cannot move a transaction to an account in another currency")
     
     # Handle balance update if amount changed
     if transaction.amount is not None and transaction.amount != existing_transaction.amount:
@@ -156,7 +324,9 @@ async def update_transaction(transaction_id: str, transaction: TransactionUpdate
             )
 
     update_data = transaction.dict(exclude_unset=True)
-    return await prisma.transaction.update(
+    updated = await prisma.transaction.update(
         where={"id": transaction_id},
         data=update_data
     )
+    invalidate(user.id)
+    return updated
@@ -0,0 +1,91 @@
+import argparse
+import importlib
+import os
+import re
+import subprocess
+import sys
+import time
+
+# Heavy dependencies that only a few endpoints need. Routers import them
+# inside the handlers so a cold worker doesn't pay for them up front.
+HEAVY_MODULES = ("numpy", "pandas", "yfinance")
+
+# Cold import budget for app.main, in milliseconds
+STARTUP_BUDGET_MS = int(os.getenv("STARTUP_BUDGET_MS", "1500"))
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORT_TIME_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+def prewarm_enabled():
+    return os.getenv("PREWARM_HEAVY_IMPORTS", "").lower() in ("1", "true", "yes")
+
+def prewarm(modules=HEAVY_MODULES):
+    """Import heavy dependencies now instead of on the first request that needs them."""
+    timings = {}
+    for name in modules:
+        start = time.perf_counter()
+        try:
+            importlib.import_module(name)
+        except ImportError as e:
+            print(f"Failed to prewarm {name}: {e}")
+            continue
+        timings[name] = (time.perf_counter() - start) * 1000
+    return timings
+
+def profile_imports(target="app.main"):
+    """Import `target` in a fresh interpreter with `-X importtime`.
+
+    Returns a list of (module, self_ms, cumulative_ms, depth) rows in import order.
+    """
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {target}"],
+        capture_output=True,
+        text=True,
+        cwd=BACKEND_DIR,
+    )
+    if proc.returncode != 0:
+        errors = "\n".join(line for line in proc.stderr.splitlines() if not line.startswith("import time:"))
+        raise RuntimeError(f"Importing {target} failed:\n{errors}")
+
+    rows = []
+    for line in proc.stderr.splitlines():
+        match = IMPORT_TIME_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, module = match.groups()
+            rows.append((module, int(self_us) / 1000, int(cumulative_us) / 1000, len(indent) // 2))
+    return rows
+
+def total_import_ms(rows, target="app.main"):
+    # Everything pulled in by the target is nested under it (or its parent packages)
+    parts = target.split(".")
+    roots = {".".join(parts[:i]) for i in range(1, len(parts) + 1)}
+    return sum(cumulative for module, _, cumulative, depth in rows if depth == 0 and module in roots)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Report import time per module for a cold start of the API.")
+    parser.add_argument("--target", default="app.main")
+    parser.add_argument("--top", type=int, default=25, help="Number of slowest modules to list")
+    parser.add_argument("--budget-ms", type=float, default=STARTUP_BUDGET_MS)
+    args = parser.parse_args(argv)
+
+    rows = profile_imports(args.target)
+    total = total_import_ms(rows, args.target)
+
+    print(f"{'cumulative ms':>14} {'self ms':>9}  module")
+    for module, self_ms, cumulative, _ in sorted(rows, key=lambda r: r[2], reverse=True)[:args.top]:
+        print(f"{cumulative:>14.1f} {self_ms:>9.1f}  {module}")
+    print(f"\nCold import of {args.target}: {total:.1f} ms (budget {args.budget_ms:.0f} ms)")
+
+    failed = False
+    eager = sorted({module.split(".")[0] for module, *_ in rows} & set(HEAVY_MODULES))
+    if eager:
+        print(f"Heavy modules imported at startup: {', '.join(eager)}")
+        failed = True
+    if total > args.budget_ms:
+        print("Startup budget exceeded")
+        failed = True
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -17,4 +17,7 @@ export const transactionsDal = {
     transfer: async (data: any) => {
         return api.post("/transactions/transfer", data);
     },
+    batch: async (operations: any[]) => {
+        return api.post("/transactions/batch", { operations });
+    },
 };